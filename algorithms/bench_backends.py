@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+bench_backends.py
+-----------------
+Time the site-side kernels (k-means E-step, logreg gradient, Pearson stats)
+with the "numpy" and "torch" backends across dataset size n, feature count d
+and cluster count k.  Runs locally – no datasite needed.
+
+Run
+----
+    poetry run python bench_backends.py                       # default grid
+    poetry run python bench_backends.py --n 100000 1000000 --d 8 64 --k 4 32
+"""
+
+from __future__ import annotations
+import argparse, os, time, uuid
+
+import numpy as np
+import pandas as pd
+
+from federated_kmeans import _site_e_step
+from federated_logreg import _site_grad
+from federated_pearson import _site_stats
+from fed_utils import BACKENDS
+
+# local run: enable the on-site cache so repeated calls time per-round work
+os.environ.setdefault("FED_SITE_CACHE_MB", "4096")
+
+
+# ----------------------------------------------------------------------
+def _time(fn, reps: int) -> float:
+    """Median wall time (ms) of `fn()` after one warm-up call."""
+    fn()                                     # fills the on-site data cache
+    ts = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        ts.append(time.perf_counter() - t0)
+    return 1e3 * float(np.median(ts))
+
+
+def bench(ns, ds, ks, batch: int, reps: int, threads=None):
+    rng = np.random.default_rng(0)
+    rows = []
+    for n in ns:
+        for d in ds:
+            X  = rng.normal(size=(n, d))
+            df = pd.DataFrame(X, columns=[f"f{i}" for i in range(d)])
+            lr = df.assign(y=(X[:, 0] > 0).astype(float))
+            xy = pd.DataFrame({"x": X[:, 0], "y": X[:, 1 % d]})
+            w  = np.zeros((d + 1, 1)).tolist()
+            run = uuid.uuid4().hex
+
+            for k in ks:
+                C = rng.normal(size=(k, d)).tolist()
+                for be in BACKENDS:
+                    t = _time(lambda: _site_e_step(df, C, "bench-km", run,
+                                                   backend=be, threads=threads), reps)
+                    rows.append(("e_step", n, d, k, be, t))
+
+            for be in BACKENDS:
+                t = _time(lambda: _site_grad(lr, w, batch, "bench-lr", run,
+                                             backend=be, threads=threads), reps)
+                rows.append(("grad", n, d, "-", be, t))
+            for be in BACKENDS:
+                t = _time(lambda: _site_stats(xy, backend=be, threads=threads), reps)
+                rows.append(("stats", n, d, "-", be, t))
+    return rows
+
+
+def _print(rows):
+    print(f"{'kernel':<8}{'n':>10}{'d':>6}{'k':>6}{'backend':>9}{'ms':>12}")
+    for kern, n, d, k, be, t in rows:
+        print(f"{kern:<8}{n:>10}{d:>6}{k:>6}{be:>9}{t:>12.3f}")
+
+
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--d", type=int, nargs="+", default=[2, 16, 64])
+    ap.add_argument("--k", type=int, nargs="+", default=[3, 16])
+    ap.add_argument("--batch", type=int, default=32)
+    ap.add_argument("--reps", type=int, default=5)
+    ap.add_argument("--threads", type=int, default=None,
+                    help="torch intra-op threads (default: leave torch's setting)")
+    args = ap.parse_args()
+    _print(bench(args.n, args.d, args.k, args.batch, args.reps, args.threads))
@@ -1,6 +1,8 @@
 # --- keep previous imports / config here -------------------------------
-from typing import List, Dict, Any
-import json, os
+from typing import List, Dict, Any, Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+import json, os, uuid
+import numpy as np
 import syft as sy
 
 # ------------------------------------------------------------------ config
@@ -27,6 +29,25 @@ def to_native(obj: Any):
     raise TypeError(f"Cannot convert {type(obj)}")
 
 
+def new_run_id() -> str:
+    """Fresh id for one training run; sites keep their prepared data per run."""
+    return uuid.uuid4().hex
+
+
+def asset_key(asset) -> str:
+    """Stable per-asset key used by the on-site data cache."""
+    return str(asset.id)
+
+
+BACKENDS = ("numpy", "torch")
+
+
+def check_backend(backend: str) -> None:
+    """Reject unknown site kernel backends before anything is submitted."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
+
 def get_assets(label_col: str | None = None):
     """
     Return (assets, feature_dim)
@@ -53,3 +74,113 @@ def get_assets(label_col: str | None = None):
             dim = asset.data.columns.drop(label_col).size + 1  # +bias
 
     return (assets, dim) if label_col else (assets, None)
+
+
+def map_sites(fn: Callable, items: Sequence) -> List[Any]:
+    """Call `fn(item)` for every site concurrently; results keep `items` order."""
+    with ThreadPoolExecutor(max_workers=max(len(items), 1)) as ex:
+        return list(ex.map(fn, items))
+
+
+def weighted_mean(values: Sequence, weights: Sequence):
+    """Average per-site results weighted by their sample counts."""
+    w = np.asarray(weights, dtype=float)
+    return np.tensordot(w / w.sum(), np.stack([np.asarray(v) for v in values]), axes=1)
+
+
+class BatchScheduler:
+    """
+    Per-site batch sizes for one round of FedAvg.
+
+    Each site's round time is modelled as  t = c + b / r : a fixed cost `c`
+    (Syft submission, network, per-call overhead) plus `b` rows at `r` rows
+    per second.  The per-row cost is fitted from the site-reported compute
+    time over at least two batch sizes (two probe rounds at 0.5× and 1.5×
+    the size-proportional split), the fixed cost from the client wall time;
+    the very first call of each site is a warm-up and is ignored.
+
+    Splitting the budget (`batch` × #sites rows, `min_batch` floors taken out
+    of it): find the shortest round time T the budget fits in (never below
+    the largest fixed cost, since every site is waited for), allow `slack`
+    on top, then share the rows in proportion to dataset size (the
+    lowest-variance split for size-weighted averaging) within what each
+    site can do by that deadline.  No site is predicted to exceed
+    (1 + slack) × T.  When latency dominates, every site has spare capacity
+    and the split is size-proportional; when compute dominates, faster
+    sites take more rows.
+    """
+
+    def __init__(self, n_sites: int, batch: int, min_batch: int | None = None,
+                 slack: float = 0.1):
+        self.budget    = batch * n_sites
+        self.batch     = batch
+        self.min_batch = max(batch // 2, 1) if min_batch is None else min_batch
+        if self.min_batch > batch:                   # floors must fit the budget
+            raise ValueError(f"min_batch={self.min_batch} exceeds batch={batch}")
+        self.slack     = slack
+        self.rows      = [None] * n_sites            # dataset size per site
+        self.obs       = [[] for _ in range(n_sites)]  # (batch, wall, compute)
+
+    def update(self, site: int, batch: int, wall: float, compute: float,
+               rows: int) -> None:
+        """Record one call: `batch` rows, client `wall` / site `compute` seconds."""
+        if self.rows[site] is not None:              # skip the warm-up call
+            self.obs[site].append((batch, wall, compute))
+        self.rows[site] = int(rows)
+
+    @property
+    def calls(self) -> int:
+        """Rounds every site has completed (warm-up included)."""
+        if any(r is None for r in self.rows):
+            return 0
+        return 1 + min(len(o) for o in self.obs)
+
+    def _fit(self):
+        """Per-site (fixed cost c, seconds per row a)."""
+        fits = []
+        for obs in self.obs:
+            b, wall, comp = (np.asarray(v, dtype=float) for v in zip(*obs))
+            a = max(np.polyfit(b, comp, 1)[0], 0.0) if len(set(b)) > 1 else 0.0
+            fits.append((float(np.median(wall - a * b)), a))
+        return fits
+
+    def _split(self, weights, lo, hi, total) -> List[int]:
+        """Integer b_i ∝ weights, clipped to [lo, hi], summing to `total`."""
+        lo = np.asarray(lo, dtype=float)
+        hi = np.maximum(np.floor(hi), lo)
+        total  = float(np.clip(total, lo.sum(), hi.sum()))
+        s_lo, s_hi = 0.0, float((hi / weights).max())
+        for _ in range(60):                          # bisection on the scale
+            s = 0.5 * (s_lo + s_hi)
+            s_lo, s_hi = (s, s_hi) if np.clip(s * weights, lo, hi).sum() < total else (s_lo, s)
+        size = np.clip(s_hi * weights, lo, hi)
+        base = np.floor(size)
+        for i in np.argsort(base - size)[: int(round(total - base.sum()))]:
+            base[i] += 1                             # largest remainder
+        return [int(b) for b in np.minimum(base, hi)]
+
+    def batches(self) -> List[int]:
+        """Batch size for every site in the next round."""
+        if self.calls == 0:                          # sizes unknown: warm-up
+            return [self.batch] * len(self.rows)
+
+        n     = np.asarray(self.rows, dtype=float)
+        floor = np.minimum(self.min_batch, n)
+        if self.calls < 3:                           # probe 0.5× / 1.5× (mean: budget)
+            prop = self._split(n, floor, n, self.budget)
+            f    = 0.5 if self.calls == 1 else 1.5
+            return [int(np.clip(round(f * b), 1, m)) for b, m in zip(prop, n)]
+
+        c, a = (np.asarray(v) for v in zip(*self._fit()))
+
+        def capacity(T):                             # rows each site can do by T
+            rows = np.where(a > 0, (T - c) / np.where(a > 0, a, 1), n)
+            return np.clip(rows, floor, n)
+
+        need  = min(self.budget, n.sum())
+        t_lo  = float(c.max())                       # no round ends before that
+        t_hi  = float((c + n * a).max()) + 1e-9
+        for _ in range(60):                          # shortest feasible deadline
+            T = 0.5 * (t_lo + t_hi)
+            t_lo, t_hi = (T, t_hi) if capacity(T).sum() < need else (t_lo, T)
+        return self._split(n, floor, capacity(t_hi * (1 + self.slack)), need)
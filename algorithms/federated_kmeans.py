@@ -12,57 +12,147 @@ Run
 from __future__ import annotations
 import numpy as np
 import syft as sy
-from fed_utils import SITES, get_assets, to_native
+from fed_utils import SITES, get_assets, to_native, new_run_id, asset_key, check_backend
 
 
 # ----------------------------------------------------------------------
-# local E-step: given current centres, return (partial_sums, counts)
+# local E-step: given current centres, return (partial_sums, counts, inertia)
+# If the data owner opts in (FED_SITE_CACHE_MB > 0 on the datasite), the
+# contiguous float matrix and its row norms are cached per (asset `key`, `run`)
+# so iterations skip the DataFrame → array copy; the entry is dropped on the
+# `last` call and the cache is capped at that many MB.  Cached rows live in
+# server memory other user code could read, bypassing Syft's per-asset input
+# policy – hence opt-in.
+# `splits` lets several centre sets (e.g. different k) share one request:
+# centres are stacked row-wise and each group is assigned independently.
+# backend="torch" uses cdist / index_add_ / bincount on torch's thread pool;
+# `threads` resizes that pool (process-wide), otherwise the site keeps its own.
+# Kept at module level and self-contained: Syft ships its source to the site.
+def _site_e_step(df, centers, key, run, splits=None, backend="numpy", threads=None,
+                 last=False):
+    import os as _os
+    import sys as _sys
+    from collections import OrderedDict as _OD
+    import numpy as _np
+    if backend not in ("numpy", "torch"):
+        raise ValueError(f"Unknown backend {backend!r}; expected 'numpy' or 'torch'")
+    cap   = float(_os.environ.get("FED_SITE_CACHE_MB", 0)) * 2 ** 20
+    cache = _sys.__dict__.setdefault("_fed_site_cache", _OD())
+    ck    = ("kmeans", key, run)
+    st    = cache.get(ck) if cap else None
+    if st is not None and st["shape"] != df.shape:   # key must match the data
+        st = None
+    if st is None:
+        X  = _np.array(df.values, dtype=float, order="C")
+        st = {"X": X, "xx": _np.einsum("ij,ij->i", X, X), "shape": df.shape,
+              "bytes": X.nbytes + 8 * len(X)}
+    if cap and not last:
+        cache[ck] = st
+        cache.move_to_end(ck)
+        while sum(e["bytes"] for e in cache.values()) > cap:
+            cache.popitem(last=False)             # evict least recently used
+    else:
+        cache.pop(ck, None)                       # run finished / caching off
+
+    X       = st["X"]
+    centers = _np.asarray(centers, dtype=float)   # list → ndarray
+    K       = len(centers)
+    splits  = [K] if splits is None else list(splits)
+
+    if backend == "torch":
+        import torch as _t
+        if threads and _t.get_num_threads() != int(threads):
+            _t.set_num_threads(int(threads))    # process-wide: only on request
+        if "Xt" not in st:
+            st["Xt"] = _t.from_numpy(X)           # zero-copy view of the cache
+        Xt      = st["Xt"]
+        C       = _t.from_numpy(centers)
+        D       = _t.cdist(Xt, C)
+        sums    = _t.zeros_like(C)
+        counts  = _t.zeros(K, dtype=_t.int64)
+        inertia = _np.zeros(len(splits))
+        off     = 0
+        for g, kg in enumerate(splits):
+            dmin, lbl  = D[:, off:off + kg].min(1)
+            sums.index_add_(0, lbl + off, Xt)
+            counts    += _t.bincount(lbl + off, minlength=K)
+            inertia[g] = float((dmin * dmin).sum())
+            off       += kg
+        return sums.numpy(), counts.numpy(), inertia
+
+    d2      = st["xx"][:, None] - 2 * X @ centers.T + (centers ** 2).sum(1)
+
+    sums    = _np.zeros_like(centers)
+    counts  = _np.zeros(K, dtype=int)
+    inertia = _np.zeros(len(splits))
+    off     = 0
+    for g, kg in enumerate(splits):
+        blk        = d2[:, off:off + kg]
+        lbl        = _np.argmin(blk, axis=1)
+        for a in range(0, len(X), 1 << 16):       # chunked one-hot matmul
+            oh = (lbl[a:a + (1 << 16), None] == _np.arange(kg)).astype(float)
+            sums[off:off + kg] += oh.T @ X[a:a + (1 << 16)]
+        counts    += _np.bincount(lbl + off, minlength=K)
+        inertia[g] = _np.maximum(blk[_np.arange(len(X)), lbl], 0).sum()
+        off       += kg
+    return sums, counts, inertia
+
+
 def _make_e_step(asset):
-    @sy.syft_function_single_use(df=asset)
-    def e_step(df, centers):
-        import numpy as _np
-        X       = df.values
-        centers = _np.asarray(centers)          # list → ndarray
-        lbl     = _np.argmin(((X[:, None] - centers) ** 2).sum(2), axis=1)
-
-        K       = len(centers)
-        sums    = _np.zeros_like(centers)
-        counts  = _np.zeros(K, dtype=int)
-        for k in range(K):
-            m = lbl == k
-            if m.any():
-                sums[k]   = X[m].sum(0)
-                counts[k] = m.sum()
-        return sums, counts
-    return e_step
+    return sy.syft_function_single_use(df=asset)(_site_e_step)
 
 
 # ----------------------------------------------------------------------
-def kmeans_federated(k: int = 3, iters: int = 10, sites=SITES) -> np.ndarray:
+def kmeans_federated(k: int = 3, iters: int = 10, sites=SITES,
+                     backend: str = "numpy", threads=None) -> np.ndarray:
+    return kmeans_sweep([k], iters, sites, backend, threads)[k][0]
+
+
+def kmeans_sweep(ks=(2, 3, 4, 5), iters: int = 10, sites=SITES,
+                 backend: str = "numpy", threads=None) -> dict:
+    """
+    Run k-means for every k in `ks` at once: all centre sets travel in one
+    stacked matrix, so each iteration is one request per site.
+    Returns {k: (centres, inertia)}, the inertia of exactly those centres.
+    """
+    check_backend(backend)
     # one login per site (only once)
     assets, _ = get_assets()
     dim       = assets[0].data.shape[1]
 
     # cache a compiled e_step function per site
     e_steps = [_make_e_step(asset) for asset in assets]
+    run     = new_run_id()
 
-    # random initial centres
-    rng      = np.random.default_rng(0)
-    centers  = rng.normal(size=(k, dim))
+    ks      = [int(k) for k in ks]
+    offs    = np.cumsum([0] + ks)
+    # random initial centres, seeded per k
+    centers = np.vstack([np.random.default_rng(0).normal(size=(k, dim)) for k in ks])
 
-    for _ in range(iters):
+    def e_step_all(last):
         sum_acc = np.zeros_like(centers)
-        cnt_acc = np.zeros(k, dtype=int)
-
+        cnt_acc = np.zeros(len(centers), dtype=int)
+        inertia = np.zeros(len(ks))
         for fn, asset in zip(e_steps, assets):
-            sums, cnts = fn(df=asset, centers=centers.tolist(), blocking=True)
+            sums, cnts, inr = fn(df=asset, centers=centers.tolist(), splits=ks,
+                                 key=asset_key(asset), run=run,
+                                 backend=backend, threads=threads,
+                                 last=last, blocking=True)
             sum_acc += np.asarray(sums)
             cnt_acc += np.asarray(cnts)
+            inertia += np.asarray(inr)
+        return sum_acc, cnt_acc, inertia
 
+    for _ in range(iters):
+        sum_acc, cnt_acc, _ = e_step_all(last=False)
         mask          = cnt_acc > 0
         centers[mask] = sum_acc[mask] / cnt_acc[mask][:, None]  # M-step
 
-    return centers
+    # one more E-step so the inertia belongs to the returned centres
+    _, _, inertia = e_step_all(last=True)
+
+    return {k: (centers[offs[i]:offs[i + 1]].copy(), float(inertia[i]))
+            for i, k in enumerate(ks)}
 
 
 # ----------------------------------------------------------------------
@@ -4,47 +4,175 @@ federated_logreg.py  – synchronous FedAvg for binary logistic regression
 """
 
 from __future__ import annotations
+import time
 import numpy as np, syft as sy
-from fed_utils import SITES, get_assets
+from fed_utils import (SITES, get_assets, new_run_id, asset_key, check_backend,
+                       map_sites, weighted_mean, BatchScheduler)
 
 # ----------------------------------------------------------------------
-def _make_grad(asset, batch_sz: int):
-    """Compile once; returns mini-batch gradient."""
+# site-side kernel (self-contained: Syft ships its source to the datasite)
+def _site_grad(df, w, batch, key, run, backend="numpy", threads=None, last=False):
+    """
+    Mini-batch gradient(s), one column per weight vector, plus the site's
+    row count (the aggregation weight) and its compute time in seconds
+    (for batch scheduling): returns (G, n, seconds).
 
-    @sy.syft_function_single_use(df=asset)
-    def grad(df, w):
-        import numpy as _np
-        w = _np.asarray(w).reshape(-1, 1)            # ### FIX ###
+    If the data owner opts in (FED_SITE_CACHE_MB > 0 on the datasite), the
+    site keeps the prepared float matrix, label vector and a shuffled
+    permutation per (asset `key`, `run`), so each round only touches `batch`
+    rows; the entry is dropped on the `last` round and the cache is capped at
+    that many MB.  NOTE: cached rows live in server memory that other user
+    code could read, bypassing Syft's per-asset input policy – hence opt-in.
+    Without it every call re-prepares the data.  Rows are taken from
+    a stream of per-epoch permutations; with several configs each one gets
+    its own consecutive `batch[m]` rows, so every config sees the same kind
+    of without-replacement batches as a standalone run.
+    `backend="torch"` runs the math on torch's intra-op thread pool; `threads`
+    resizes that pool (process-wide), otherwise the site's setting is kept.
+    """
+    import os as _os
+    import sys as _sys
+    import time as _time
+    from collections import OrderedDict as _OD
+    import numpy as _np
+    if backend not in ("numpy", "torch"):
+        raise ValueError(f"Unknown backend {backend!r}; expected 'numpy' or 'torch'")
+    # w: (dim,) or (dim, M) stacked weights; batch: int or M ints
+    W  = _np.asarray(w, dtype=float)
+    W  = W.reshape(len(W), -1)
+    bs = _np.broadcast_to(_np.asarray(batch, dtype=int), (W.shape[1],))
 
-        X = _np.c_[ _np.ones(len(df)), df.drop("y", axis=1).values ]
-        y = df["y"].values.reshape(-1, 1)
+    # opt-in LRU shared by all site kernels, one entry per (algorithm, asset, run)
+    cap   = float(_os.environ.get("FED_SITE_CACHE_MB", 0)) * 2 ** 20
+    cache = _sys.__dict__.setdefault("_fed_site_cache", _OD())
+    ck    = ("logreg", key, run)
+    st    = cache.get(ck) if cap else None
+    if st is not None and st["shape"] != df.shape:   # key must match the data
+        st = None
+    if st is None:
+        X  = _np.array(df.drop("y", axis=1).values, dtype=float, order="C")
+        y  = _np.array(df["y"].values, dtype=float).reshape(-1, 1)
+        rng = _np.random.default_rng()
+        st = {"X": X, "y": y, "rng": rng, "shape": df.shape,
+              "perm": rng.permutation(len(X)), "pos": 0,
+              "bytes": X.nbytes + y.nbytes + 8 * len(X)}
+    if cap and not last:
+        cache[ck] = st
+        cache.move_to_end(ck)
+        while sum(e["bytes"] for e in cache.values()) > cap:
+            cache.popitem(last=False)           # evict least recently used
+    else:
+        cache.pop(ck, None)                     # run finished / caching off
 
-        idx        = _np.random.choice(len(df), batch_sz, replace=False)
-        Xb, yb     = X[idx], y[idx]
-        p          = 1 / (1 + _np.exp(-Xb @ w))
-        g          = (Xb.T @ (p - yb)) / batch_sz
-        return g
+    t0   = _time.perf_counter()                 # compute only: no cache build
+    n    = len(st["X"])
+    bs   = _np.minimum(bs, n)
+    need, parts = int(bs.sum()), []
+    while need:                                 # next rows of the epoch stream
+        if st["pos"] >= n:                      # epoch exhausted → reshuffle
+            st["perm"], st["pos"] = st["rng"].permutation(n), 0
+        take       = min(need, n - st["pos"])
+        parts.append(st["perm"][st["pos"]:st["pos"] + take])
+        st["pos"] += take
+        need      -= take
+    idx  = _np.concatenate(parts)
+    # config m owns its own block of rows: block-diagonal mask over Xb @ W
+    mask = _np.repeat(_np.arange(len(bs)), bs)[:, None] == _np.arange(len(bs))
 
-    return grad
+    if backend == "torch":
+        import torch as _t
+        if threads and _t.get_num_threads() != int(threads):
+            _t.set_num_threads(int(threads))    # process-wide: only on request
+        if "Xt" not in st:                      # zero-copy views of the cache
+            st["Xt"], st["yt"] = _t.from_numpy(st["X"]), _t.from_numpy(st["y"])
+        it     = _t.from_numpy(idx)
+        Xb, yb = st["Xt"].index_select(0, it), st["yt"].index_select(0, it)
+        Wt     = _t.from_numpy(W)
+        P      = _t.sigmoid(_t.addmm(Wt[:1], Xb, Wt[1:]))
+        R      = (P - yb) * _t.from_numpy(mask)
+        G      = _t.cat([R.sum(0, keepdim=True), Xb.T @ R]) / _t.from_numpy(bs)
+        return G.numpy(), n, _time.perf_counter() - t0
+
+    Xb, yb     = st["X"][idx], st["y"][idx]
+    P          = 1 / (1 + _np.exp(-(Xb @ W[1:] + W[0])))
+    R          = (P - yb) * mask
+    G          = _np.vstack([R.sum(0), Xb.T @ R]) / bs       # bias first
+    return G, n, _time.perf_counter() - t0
+
+
+def _make_grad(asset):
+    """Compile once; returns the site gradient function for `asset`."""
+    return sy.syft_function_single_use(df=asset)(_site_grad)
 
 
 # ----------------------------------------------------------------------
-def train_logreg_fed(epochs=20, lr=0.1, batch=32, sites=SITES) -> np.ndarray:
+def train_logreg_fed(epochs=20, lr=0.1, batch=32, sites=SITES,
+                     backend="numpy", threads=None, adaptive=False) -> np.ndarray:
+    """
+    Sites are queried concurrently and gradients are averaged weighted by
+    each site's row count.  `batch` is the per-site batch; with `adaptive`
+    it becomes the mean per-site batch and BatchScheduler re-splits it every
+    round from each site's fitted round-time model and dataset size.
+    """
+    check_backend(backend)
     assets, dim = get_assets("y")          # one login per site
     w = np.zeros((dim, 1))
 
-    grad_fns = [_make_grad(a, batch) for a in assets]
+    grad_fns = [_make_grad(a) for a in assets]
+    run      = new_run_id()
+    sched    = BatchScheduler(len(assets), batch)
 
-    for _ in range(epochs):
-        grads = [
-            np.asarray(fn(df=a, w=w.tolist(), blocking=True))
-            for fn, a in zip(grad_fns, assets)
-        ]
-        w -= lr * np.mean(np.stack(grads), axis=0)
+    def call(i):
+        t0 = time.perf_counter()
+        g, n, secs = grad_fns[i](df=assets[i], w=w.tolist(), batch=sizes[i],
+                                 key=asset_key(assets[i]), run=run,
+                                 backend=backend, threads=threads,
+                                 last=ep == epochs - 1, blocking=True)
+        return g, n, secs, time.perf_counter() - t0
+
+    for ep in range(epochs):
+        sizes = sched.batches() if adaptive else [batch] * len(assets)
+        res   = map_sites(call, range(len(assets)))
+        for i, (_, n, secs, wall) in enumerate(res):
+            sched.update(i, min(sizes[i], int(n)), wall, secs, n)
+        w -= lr * weighted_mean([r[0] for r in res], [r[1] for r in res])
 
     return w.flatten()
 
 
+def sweep_logreg_fed(lrs=(0.01, 0.05, 0.1), batches=(16, 32, 64),
+                     epochs=20, sites=SITES,
+                     backend="numpy", threads=None) -> dict:
+    """
+    Grid search over (lr, batch): every config's weights are stacked into one
+    (dim, M) matrix, so each round is a single request per site.  Each config
+    gets its own rows every round (sum(batches) rows are drawn per site), so
+    a config samples like train_logreg_fed with the same batch would.
+    Returns {(lr, batch): weights}.
+    """
+    check_backend(backend)
+    assets, dim = get_assets("y")
+    grid  = [(lr, b) for lr in lrs for b in batches]
+    lr_v  = np.array([lr for lr, _ in grid])
+    b_v   = [int(b) for _, b in grid]
+    W     = np.zeros((dim, len(grid)))
+
+    grad_fns = [_make_grad(a) for a in assets]
+    run      = new_run_id()
+
+    for ep in range(epochs):
+        res = map_sites(
+            lambda i: grad_fns[i](df=assets[i], w=W.tolist(), batch=b_v,
+                                  key=asset_key(assets[i]), run=run,
+                                  backend=backend, threads=threads,
+                                  last=ep == epochs - 1, blocking=True),
+            range(len(assets)),
+        )
+        W -= lr_v * weighted_mean([g for g, _, _ in res], [n for _, n, _ in res])
+
+    return {cfg: W[:, m].copy() for m, cfg in enumerate(grid)}
+
+
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
     weights = train_logreg_fed(epochs=25, lr=0.05, batch=32)
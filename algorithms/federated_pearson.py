@@ -2,21 +2,35 @@
 from __future__ import annotations
 import numpy as np
 import syft as sy
-from fed_utils import SITES, get_assets, to_native
+from fed_utils import SITES, get_assets, to_native, check_backend
 
 
 # ----------------------------------------------------------------------
-def _stats_fn(asset):
-    @sy.syft_function_single_use(df=asset)
-    def stats(df):
+# site-side kernel (self-contained: Syft ships its source to the datasite)
+def _site_stats(df, backend="numpy", threads=None):
+    if backend not in ("numpy", "torch"):
+        raise ValueError(f"Unknown backend {backend!r}; expected 'numpy' or 'torch'")
+    if backend == "torch":
         import numpy as _np
-        x, y = df["x"], df["y"]
-        return len(df), float(x.sum()), float(y.sum()), \
-               float((x ** 2).sum()), float((y ** 2).sum()), float((x * y).sum())
-    return stats
+        import torch as _t
+        if threads and _t.get_num_threads() != int(threads):
+            _t.set_num_threads(int(threads))    # process-wide: only on request
+        A = _t.from_numpy(_np.array(df[["x", "y"]].values, dtype=float, order="C"))
+        s = A.sum(0)
+        G = A.T @ A                             # [[Σx², Σxy], [Σxy, Σy²]]
+        return len(df), float(s[0]), float(s[1]), \
+               float(G[0, 0]), float(G[1, 1]), float(G[0, 1])
+    x, y = df["x"], df["y"]
+    return len(df), float(x.sum()), float(y.sum()), \
+           float((x ** 2).sum()), float((y ** 2).sum()), float((x * y).sum())
+
+
+def _stats_fn(asset):
+    return sy.syft_function_single_use(df=asset)(_site_stats)
 
 
-def pearson(sites=SITES):
+def pearson(sites=SITES, backend="numpy", threads=None):
+    check_backend(backend)
     # get_assets now returns (assets, dim) -> unpack the first element
     assets, _ = get_assets()
 
@@ -25,7 +39,7 @@ def pearson(sites=SITES):
 
     results = []
     for fn, asset in zip(stats_fns, assets):
-        res = fn(df=asset, blocking=True)
+        res = fn(df=asset, backend=backend, threads=threads, blocking=True)
         results.append(to_native(res))
 
     n, sx, sy, sxx, syy, sxy = np.sum(results, axis=0)